@@ -1,16 +1,111 @@
 import sys
 import json
 import os
+import math
+import importlib.util
+import multiprocessing
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QFileDialog, QLabel, QVBoxLayout, QPushButton, QGraphicsView, QGraphicsScene, QGraphicsRectItem, QListWidget, QHBoxLayout, QListWidgetItem, QWidget, QHBoxLayout, QProgressBar, QMessageBox
+    QApplication, QMainWindow, QFileDialog, QLabel, QVBoxLayout, QPushButton, QGraphicsView, QGraphicsScene, QGraphicsRectItem, QGraphicsItem, QGraphicsItemGroup, QGraphicsTextItem, QListWidget, QHBoxLayout, QListWidgetItem, QWidget, QHBoxLayout, QProgressBar, QMessageBox
 )
-from PyQt5.QtGui import QPixmap, QColor, QImage, QCursor, QPen, QFont
-from PyQt5.QtCore import Qt, QRectF, QThread, pyqtSignal
-from fitz import Document, Matrix, Rect
-import pandas as pd
+from PyQt5.QtGui import QPixmap, QColor, QImage, QCursor, QPen, QFont, QTransform
+from PyQt5.QtCore import Qt, QRectF, QThread, QTimer, pyqtSignal
+from fitz import Document, Matrix, Rect, TOOLS, TEXTFLAGS_TEXT, TEXT_PRESERVE_IMAGES
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+
+# Number of rendered pages kept for quick zoom and navigation
+PIXMAP_CACHE_SIZE = 8
+
+# Delay before re-rendering after the last zoom wheel tick or scroll
+RENDER_DELAY_MS = 50
+
+# Visible area is rendered in whole tiles of this many pixels, so small scrolls reuse the cache
+RENDER_TILE_SIZE = 512
+
+# Text extraction flags: the ones get_text("text") uses, including CID mapping for fonts
+# without a ToUnicode table. Images are masked out explicitly since we only export text.
+TEXT_FLAGS = TEXTFLAGS_TEXT & ~TEXT_PRESERVE_IMAGES
+
+def load_template(template_path):
+    with open(template_path, 'r') as f:
+        template = json.load(f)
+
+    if not isinstance(template, list):
+        raise ValueError("Template file must contain a list of pages.")
+
+    pages = []
+    for page in template:
+        if not isinstance(page, dict) or 'page' not in page or 'coordinates' not in page:
+            raise ValueError("Each page in the template must contain 'page' and 'coordinates' keys.")
+        if not isinstance(page['coordinates'], list):
+            raise ValueError("The 'coordinates' key must be associated with a list of areas.")
+
+        # Build each area's Rect once here instead of for every PDF
+        rects = []
+        for area in page['coordinates']:
+            if not isinstance(area, dict) or not all(k in area for k in ['x', 'y', 'width', 'height']):
+                raise ValueError("Each area must contain 'x', 'y', 'width', and 'height' keys.")
+            rects.append(Rect(area['x'], area['y'], area['x'] + area['width'], area['y'] + area['height']))
+
+        # Pages stay in template order, since row order maps output cells back to areas
+        pages.append((page['page'], rects))
+
+    return pages
+
+def extract_page(page, rects):
+    # Lay out the page once and read every area from the same text page
+    textpage = page.get_textpage(flags=TEXT_FLAGS)
+    return [page.get_textbox(rect, textpage=textpage).strip() for rect in rects]
+
+def extract_one(pdf_path, pages):
+    data = []
+
+    with Document(pdf_path) as doc:
+        for page_num, rects in pages:
+            # The page and its text page are released as soon as extract_page returns
+            data.extend(extract_page(doc[page_num], rects))
+
+    # Empty MuPDF's object store so long-lived workers do not keep growing
+    TOOLS.store_shrink(100)
+
+    return data
+
+def save_to_excel(data, output_path):
+    if xlsxwriter is not None:
+        # Stream rows to disk as they are written. write_string keeps every value a plain
+        # string; the generic write() behind write_column turns "{=...}" into array formulas.
+        workbook = xlsxwriter.Workbook(output_path, {'constant_memory': True})
+        worksheet = workbook.add_worksheet()
+        write_string = worksheet.write_string
+        for row, text in enumerate(data):
+            write_string(row, 0, text)
+        workbook.close()
+        return
+
+    if importlib.util.find_spec("lxml") is None:
+        warnings.warn("lxml is not installed, saving with openpyxl will be slow.")
+
+    # Write-only mode streams rows to the sheet instead of keeping every cell in memory
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    append = worksheet.append
+    for text in data:
+        # Force a string cell so text starting with "=" is not saved as a formula
+        cell = WriteOnlyCell(worksheet, value=text)
+        cell.data_type = 's'
+        append((cell,))
+    workbook.save(output_path)
 
 class PDFProcessingThread(QThread):
     progress = pyqtSignal(int)
+    error = pyqtSignal(str)
     finished = pyqtSignal()
 
     def __init__(self, template_path, pdf_paths, output_path):
@@ -21,54 +116,53 @@ class PDFProcessingThread(QThread):
 
     def run(self):
         try:
-            with open(self.template_path, 'r') as f:
-                template = json.load(f)
-
-            if not isinstance(template, list):
-                raise ValueError("Template file must contain a list of pages.")
-
-            for page in template:
-                if not isinstance(page, dict) or 'page' not in page or 'coordinates' not in page:
-                    raise ValueError("Each page in the template must contain 'page' and 'coordinates' keys.")
-                if not isinstance(page['coordinates'], list):
-                    raise ValueError("The 'coordinates' key must be associated with a list of areas.")
-                for area in page['coordinates']:
-                    if not isinstance(area, dict) or not all(k in area for k in ['x', 'y', 'width', 'height']):
-                        raise ValueError("Each area must contain 'x', 'y', 'width', and 'height' keys.")
+            # Parsed once here and handed to every worker
+            pages = load_template(self.template_path)
+
+            results = {}
+            last_pct = -1
+
+            # PDFs are independent, so extract them in parallel worker processes.
+            # Each worker opens its own file, so reads already overlap with extraction.
+            # Workers are spawned rather than forked from this Qt process mid-render.
+            with ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                futures = {
+                    executor.submit(extract_one, pdf_path, pages): idx
+                    for idx, pdf_path in enumerate(self.pdf_paths)
+                }
+
+                for done, future in enumerate(as_completed(futures), start=1):
+                    idx = futures[future]
+                    try:
+                        results[idx] = future.result()
+                    except Exception as e:
+                        # Fail the batch now instead of waiting for the queued files to run
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise RuntimeError(f"{self.pdf_paths[idx]}: {str(e) or type(e).__name__}") from e
+
+                    # Only signal the UI when the percentage actually changes
+                    pct = done * 100 // len(self.pdf_paths)
+                    if pct != last_pct:
+                        self.progress.emit(pct)
+                        last_pct = pct
 
             data = []
 
-            for idx, pdf_path in enumerate(self.pdf_paths):
-                doc = Document(pdf_path)
-
-                for page_template in template:
-                    page_num = page_template['page']
-                    coordinates = page_template['coordinates']
-
-                    page = doc[page_num]
-
-                    for area in coordinates:
-                        rect = Rect(
-                            area['x'],
-                            area['y'],
-                            area['x'] + area['width'],
-                            area['y'] + area['height']
-                        )
-                        text = page.get_text("blocks", clip=rect)
-                        extracted_text = "\n".join(block[4].strip() for block in text)
-                        data.append(extracted_text)
-
+            # Keep the output in the order the files were selected
+            for idx in range(len(self.pdf_paths)):
+                data.extend(results[idx])
                 # Add a blank line between files
                 data.append("")
 
-                self.progress.emit(int((idx + 1) / len(self.pdf_paths) * 100))
-
             # Save data to Excel
-            df = pd.DataFrame({"Extracted Text": data})
-            df.to_excel(self.output_path, index=False, header=False)
+            save_to_excel(data, self.output_path)
 
         except Exception as e:
-            print(f"Error: {e}")
+            # Some exceptions have an empty message, so fall back to the type name
+            self.error.emit(str(e) or type(e).__name__)
 
         self.finished.emit()
 
@@ -87,7 +181,17 @@ class PDFMarkupTool(QMainWindow):
         self.current_page_index = 0
         self.selected_areas = []  # Stores areas in original scale
         self.rect_items = []  # Stores QGraphicsRectItems
+        self.label_items = []  # Stores area number labels drawn in the scene
+        self.frame_labels = []  # Stores QLabels of rect_list rows
+        self.remove_buttons = []  # Stores remove QPushButtons of rect_list rows
+        self.page_item = None  # QGraphicsPixmapItem showing the current page
         self.scale_factor = 1.0
+        self._pix_cache = OrderedDict()  # Rendered QPixmaps keyed by (page index, scale, tiles)
+
+        # Collapse a burst of zoom wheel ticks or scrolling into a single render
+        self._render_timer = QTimer(self)
+        self._render_timer.setSingleShot(True)
+        self._render_timer.timeout.connect(self.show_page)
 
         # Load button
         self.load_button = QPushButton("Load PDF")
@@ -109,6 +213,14 @@ class PDFMarkupTool(QMainWindow):
         self.scene = QGraphicsScene()
         self.view.setScene(self.scene)
         self.view.setMouseTracking(True)
+        # Only the visible part of the page is rendered, so re-render on scroll
+        self.view.horizontalScrollBar().valueChanged.connect(self.throttle_render)
+        self.view.verticalScrollBar().valueChanged.connect(self.throttle_render)
+
+        # Selected areas live in one group in page coordinates, scaled as a whole on zoom
+        self._overlay_group = QGraphicsItemGroup()
+        self.scene.addItem(self._overlay_group)
+
         self.main_layout.addWidget(self.view, stretch=3)
 
         # List of rectangles
@@ -150,6 +262,7 @@ class PDFMarkupTool(QMainWindow):
         file_path, _ = QFileDialog.getOpenFileName(self, "Open PDF", "", "PDF Files (*.pdf)")
         if file_path:
             self.pdf_document = Document(file_path)
+            self._pix_cache.clear()
             self.current_page_index = 0
             self.show_page()
 
@@ -166,68 +279,133 @@ class PDFMarkupTool(QMainWindow):
         if not output_path:
             return
 
+        self.processing_error = None
         self.thread = PDFProcessingThread(template_path, pdf_paths, output_path)
         self.thread.progress.connect(self.progress_bar.setValue)
+        self.thread.error.connect(self.processing_failed)
         self.thread.finished.connect(self.processing_finished)
         self.thread.start()
 
+    def processing_failed(self, message):
+        # Shown once the thread finishes, in place of the success message
+        self.processing_error = message
+
     def processing_finished(self):
-        QMessageBox.information(self, "Processing Complete", "The files have been processed and saved successfully.")
+        if self.processing_error is not None:
+            QMessageBox.critical(self, "Processing Failed", f"The files could not be processed:\n{self.processing_error}")
+        else:
+            QMessageBox.information(self, "Processing Complete", "The files have been processed and saved successfully.")
         self.progress_bar.setValue(0)
 
     def show_page(self):
         if not self.pdf_document:
             return
 
-        # Clear current scene
-        self.scene.clear()
-        self.rect_items.clear()
-        self.rect_list.clear()
-
-        # Render current page to QPixmap and add to the scene
         page = self.pdf_document[self.current_page_index]
+        self.scene.setSceneRect(self.scale_rect(QRectF(0, 0, page.rect.width, page.rect.height)))
+
+        # Render the visible part of the page and swap it into the scene
+        pixmap, x, y = self.render_page(page)
+        if self.page_item is None:
+            self.page_item = self.scene.addPixmap(pixmap)
+            self.page_item.setZValue(-1)
+        else:
+            self.page_item.setPixmap(pixmap)
+        self.page_item.setPos(x, y)
+
+        # Rescale selected areas
+        self._overlay_group.setTransform(QTransform.fromScale(self.scale_factor, self.scale_factor))
+
+    def scale_rect(self, rect):
+        return QRectF(
+            rect.x() * self.scale_factor,
+            rect.y() * self.scale_factor,
+            rect.width() * self.scale_factor,
+            rect.height() * self.scale_factor
+        )
+
+    def add_area(self, rect):
+        self.selected_areas.append(rect)
+        index = len(self.selected_areas) - 1
+
+        fixed_rect = QGraphicsRectItem(rect)
+        pen = QPen(QColor("red"))
+        # Keep the outline one pixel wide whatever the zoom
+        pen.setCosmetic(True)
+        fixed_rect.setPen(pen)
+        self._overlay_group.addToGroup(fixed_rect)
+        self.rect_items.append(fixed_rect)
+
+        # Add label with number inside the rectangle, at a fixed font size
+        label = QGraphicsTextItem(f"{index + 1}")
+        label.setDefaultTextColor(QColor("blue"))
+        label.setFont(QFont("Arial", 12))
+        label.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        label.setPos(rect.x(), rect.y())
+        self._overlay_group.addToGroup(label)
+        self.label_items.append(label)
+
+        # Add to rect_list
+        item_widget = QWidget()
+        item_layout = QHBoxLayout()
+        item_layout.setContentsMargins(0, 0, 0, 0)
+        item_layout.setSpacing(5)
+
+        list_item = QListWidgetItem()
+        label_text = QLabel(f"Frame №{index + 1}")
+        remove_button = QPushButton(f"Remove №{index + 1}")
+        # Look the row up on click, since removals shift the indices
+        remove_button.clicked.connect(lambda _, item=list_item: self.remove_rect(self.rect_list.row(item)))
+        self.frame_labels.append(label_text)
+        self.remove_buttons.append(remove_button)
+
+        item_layout.addWidget(label_text)
+        item_layout.addWidget(remove_button)
+        item_widget.setLayout(item_layout)
+
+        self.rect_list.addItem(list_item)
+        self.rect_list.setItemWidget(list_item, item_widget)
+
+    def render_page(self, page):
+        scene_rect = self.scene.sceneRect()
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect().intersected(scene_rect)
+        if visible.isEmpty():
+            visible = scene_rect
+
+        # Grow the visible area to whole tiles, plus one margin tile on every side so
+        # scrolling shows already rendered content until the next render catches up
+        x0 = max(math.floor(visible.left() / RENDER_TILE_SIZE) - 1, 0) * RENDER_TILE_SIZE
+        y0 = max(math.floor(visible.top() / RENDER_TILE_SIZE) - 1, 0) * RENDER_TILE_SIZE
+        x1 = min((math.ceil(visible.right() / RENDER_TILE_SIZE) + 1) * RENDER_TILE_SIZE, scene_rect.right())
+        y1 = min((math.ceil(visible.bottom() / RENDER_TILE_SIZE) + 1) * RENDER_TILE_SIZE, scene_rect.bottom())
+
+        key = (self.current_page_index, round(self.scale_factor, 3), x0, y0, x1, y1)
+        if key in self._pix_cache:
+            self._pix_cache.move_to_end(key)
+            return self._pix_cache[key]
+
         matrix = Matrix(self.scale_factor, self.scale_factor)
-        pix = page.get_pixmap(matrix=matrix)
-        image = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
+        clip = Rect(x0, y0, x1, y1) / self.scale_factor
+        pix = page.get_pixmap(matrix=matrix, clip=clip, alpha=False)
+        # Wrap MuPDF's sample buffer without copying it; fromImage copies it into
+        # the cached pixmap once, in the native format used for every repaint
+        image = QImage(pix.samples_mv, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
         pixmap = QPixmap.fromImage(image)
-        self.scene.addPixmap(pixmap)
-
-        # Reapply selected areas
-        for index, rect in enumerate(self.selected_areas):
-            scaled_rect = QRectF(
-                rect.x() * self.scale_factor,
-                rect.y() * self.scale_factor,
-                rect.width() * self.scale_factor,
-                rect.height() * self.scale_factor
-            )
-            fixed_rect = QGraphicsRectItem(scaled_rect)
-            fixed_rect.setPen(QPen(QColor("red")))
-            self.scene.addItem(fixed_rect)
-            self.rect_items.append(fixed_rect)
-
-            # Add label with number inside the rectangle
-            label = self.scene.addText(f"{index + 1}")
-            label.setDefaultTextColor(QColor("blue"))
-            label.setFont(QFont("Arial", 12))
-            label.setPos(scaled_rect.x(), scaled_rect.y())
-
-            # Add to rect_list
-            item_widget = QWidget()
-            item_layout = QHBoxLayout()
-            item_layout.setContentsMargins(0, 0, 0, 0)
-            item_layout.setSpacing(5)
-
-            label_text = QLabel(f"Frame №{index + 1}")
-            remove_button = QPushButton(f"Remove №{index + 1}")
-            remove_button.clicked.connect(lambda _, i=index: self.remove_rect(i))
-
-            item_layout.addWidget(label_text)
-            item_layout.addWidget(remove_button)
-            item_widget.setLayout(item_layout)
-
-            list_item = QListWidgetItem()
-            self.rect_list.addItem(list_item)
-            self.rect_list.setItemWidget(list_item, item_widget)
+
+        # pix.x and pix.y are the top-left corner of the clip in scaled page pixels
+        rendered = (pixmap, pix.x, pix.y)
+        self._pix_cache[key] = rendered
+        if len(self._pix_cache) > PIXMAP_CACHE_SIZE:
+            self._pix_cache.popitem(last=False)
+        return rendered
+
+    def schedule_render(self):
+        self._render_timer.start(RENDER_DELAY_MS)
+
+    def throttle_render(self):
+        # Unlike schedule_render, don't push a pending render back, so long scrolls keep painting
+        if not self._render_timer.isActive():
+            self._render_timer.start(RENDER_DELAY_MS)
 
     def prev_page(self):
         if self.current_page_index > 0:
@@ -257,11 +435,15 @@ class PDFMarkupTool(QMainWindow):
             else:
                 self.scale_factor *= 0.9
 
-            self.show_page()
+            self.schedule_render()
 
     def eventFilter(self, source, event):
         if source == self.view.viewport():
-            if event.type() == event.MouseButtonPress and self.is_shift_pressed:
+            if event.type() == event.Resize:
+                # The viewport size decides which part of the page is rendered
+                self.schedule_render()
+
+            elif event.type() == event.MouseButtonPress and self.is_shift_pressed:
                 if event.button() == Qt.LeftButton:
                     self.start_pos = self.view.mapToScene(event.pos())
 
@@ -287,37 +469,11 @@ class PDFMarkupTool(QMainWindow):
                         rect.width() / self.scale_factor,
                         rect.height() / self.scale_factor
                     )
-                    self.selected_areas.append(original_rect)
-
-                    fixed_rect = QGraphicsRectItem(rect)
-                    fixed_rect.setPen(QPen(QColor("red")))
-                    self.scene.addItem(fixed_rect)
-                    self.rect_items.append(fixed_rect)
-
-                    # Add label with number inside the rectangle
-                    index = len(self.selected_areas) - 1
-                    label = self.scene.addText(f"{index + 1}")
-                    label.setDefaultTextColor(QColor("blue"))
-                    label.setFont(QFont("Arial", 12))
-                    label.setPos(rect.x(), rect.y())
-
-                    # Add to rect_list
-                    item_widget = QWidget()
-                    item_layout = QHBoxLayout()
-                    item_layout.setContentsMargins(0, 0, 0, 0)
-                    item_layout.setSpacing(5)
-
-                    label_text = QLabel(f"Frame №{index + 1}")
-                    remove_button = QPushButton(f"Remove №{index + 1}")
-                    remove_button.clicked.connect(lambda _, i=index: self.remove_rect(i))
-
-                    item_layout.addWidget(label_text)
-                    item_layout.addWidget(remove_button)
-                    item_widget.setLayout(item_layout)
-
-                    list_item = QListWidgetItem()
-                    self.rect_list.addItem(list_item)
-                    self.rect_list.setItemWidget(list_item, item_widget)
+                    self.add_area(original_rect)
+
+                    # Drop the dotted preview rectangle
+                    if self.rect_item:
+                        self.scene.removeItem(self.rect_item)
 
                     self.start_pos = None
                     self.rect_item = None
@@ -327,14 +483,23 @@ class PDFMarkupTool(QMainWindow):
     def remove_rect(self, index):
         if 0 <= index < len(self.rect_items):
             # Remove from scene
-            self.scene.removeItem(self.rect_items[index])
-            del self.rect_items[index]
+            for item in (self.rect_items.pop(index), self.label_items.pop(index)):
+                self._overlay_group.removeFromGroup(item)
+                self.scene.removeItem(item)
+
+            # Remove from list
+            self.rect_list.takeItem(index)
+            del self.frame_labels[index]
+            del self.remove_buttons[index]
 
             # Remove from data
             del self.selected_areas[index]
 
-            # Refresh list
-            self.show_page()
+            # Renumber the areas that moved up
+            for i in range(index, len(self.selected_areas)):
+                self.label_items[i].setPlainText(f"{i + 1}")
+                self.frame_labels[i].setText(f"Frame №{i + 1}")
+                self.remove_buttons[i].setText(f"Remove №{i + 1}")
 
     def save_template(self):
         template_data = [
@@ -358,6 +523,8 @@ class PDFMarkupTool(QMainWindow):
                 json.dump(template_data, f, indent=4)
 
 if __name__ == "__main__":
+    # Extraction workers are spawned, so frozen builds must not relaunch the GUI in them
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = PDFMarkupTool()
     window.show()